@@ -22,8 +22,43 @@ docstring
 NOTE: Any leading # in a docstring gets turned to a quadruple ####
 """
 import ast
+import functools
+import inspect
+import os
 import sys
-import re
+from itertools import chain
+from operator import attrgetter
+
+_get_arg = attrgetter('arg')
+_FuncDef = ast.FunctionDef
+_ClassDef = ast.ClassDef
+# below this many files starting worker processes costs more than it saves
+_PARALLEL_MIN_FILES = 8
+
+
+@functools.lru_cache(maxsize=4096)
+def format_docstring_lines(docstring):
+    """Formats a docstring into a tuple of lines in a single pass. Any
+    leading # will be converted to #### for formatting consistency. Results
+    are cached, as boilerplate docstrings tend to repeat.
+
+    # args
+    - docstring -str: the dosctring to be formatted.
+    """
+    if not isinstance(docstring, str):
+        return ()
+    if '#' not in docstring:
+        return tuple(docstring.split('\n'))
+    out = []
+    for line in docstring.split('\n'):
+        if line.startswith('#'):
+            i = len(line) - len(line.lstrip('#'))
+            if line[i:i + 1] == ' ':
+                i += 1
+            out.append('#### ' + line[i:])
+        else:
+            out.append(line)
+    return tuple(out)
 
 
 def format_docstring(docstring):
@@ -34,8 +69,34 @@ def format_docstring(docstring):
     - docstring -str: the dosctring to be formatted.
     """
     if isinstance(docstring, str):
-        result = re.sub(r'^#+ ?', '#### ', docstring, flags=re.MULTILINE)
-        return result
+        return '\n'.join(format_docstring_lines(docstring))
+    return None
+
+
+def _doc_lines(node):
+    """Returns the formatted docstring lines of a node, or ('None',) if it
+    has no docstring.
+
+    # args
+    - node -AST: a Module, ClassDef, or FunctionDef node
+    """
+    return format_docstring_lines(_fast_docstring(node)) or ('None',)
+
+
+def _fast_docstring(node):
+    """Returns the cleaned docstring of a node, or None if it has none. Same
+    result as ast.get_docstring, checking the first body node only once.
+
+    # args
+    - node -AST: a Module, ClassDef, or FunctionDef node
+    """
+    body = node.body
+    if body:
+        first = body[0]
+        if isinstance(first, ast.Expr):
+            value = first.value
+            if isinstance(value, ast.Constant) and isinstance(value.value, str):
+                return inspect.cleandoc(value.value)
     return None
 
 
@@ -45,12 +106,9 @@ def class_stub(class_node):
     # args
     - class_node -ClassDef: the class node from which to generate the stub.
     """
-    stub = '`class ' + class_node.name
-    bases = [getattr(n, 'id', 'unnamed') for n in class_node.bases]
-    if bases:
-        stub += '(' + ', '.join(bases) + ')'
-    stub += '`:'
-    return stub
+    bases = ', '.join(getattr(n, 'id', 'unnamed') for n in class_node.bases)
+    inner = f'({bases})' if bases else ''
+    return f'`class {class_node.name}{inner}`:'
 
 
 def func_stub(func_node):
@@ -59,68 +117,151 @@ def func_stub(func_node):
     # args
     - func_node -FuncDef: the function from which to generate the stub
     """
-    name = func_node.name
-    stub = f'def `{name}('
-    args = [arg.arg for arg in func_node.args.args]
-    stub += ', '.join(args)
-    stub += ')`:'
-    return stub
+    a = func_node.args
+    if a.vararg:
+        star = ('*' + a.vararg.arg,)
+    elif a.kwonlyargs:
+        star = ('*',)
+    else:
+        star = ()
+    args = ', '.join(chain(
+        map(_get_arg, a.posonlyargs),
+        ('/',) if a.posonlyargs else (),
+        map(_get_arg, a.args),
+        star,
+        map(_get_arg, a.kwonlyargs),
+        ('**' + a.kwarg.arg,) if a.kwarg else (),
+    ))
+    return f'def `{func_node.name}({args})`:'
 
 
-def print_func(func_node, indent=False):
-    """Prints a function stub and it's docstring.
+def _append_func(func_node, indent, out):
+    """Appends a function stub and it's docstring to the output lines.
 
     # args
-    - func_node -: the function to be printed
-    - indent -bool(False): if True, prints '##' before the stub, else '#'
+    - func_node -: the function to be documented
+    - indent -bool: if True, prefixes the stub with '#', else '##'
+    - out -list[str]: the output lines to append to
     """
     if indent:
         stub = '# ' + func_stub(func_node)
     else:
         stub = '## ' + func_stub(func_node)
-    print(stub)
-    print(format_docstring(ast.get_docstring(func_node)))
-    print()
+    out.append(stub)
+    out.extend(_doc_lines(func_node))
+    out.append('')
 
 
-def gendoc(f):
-    """Generates the docs from a file.
+def print_func(func_node, indent=False):
+    """Prints a function stub and it's docstring.
 
     # args
-    - f -str: a filename
+    - func_node -: the function to be printed
+    - indent -bool(False): if True, prints '#' before the stub, else '##'
+    """
+    out = []
+    _append_func(func_node, indent, out)
+    sys.stdout.write('\n'.join(out) + '\n')
+
+
+class _Collector(ast.NodeVisitor):
+    """Collects the top level functions and classes of a module in a single
+    pass over its body.
+    """
+    def __init__(self):
+        self.functions = []
+        self.classes = []
+
+    def visit_Module(self, node):
+        for child in node.body:
+            t = type(child)
+            if t is _FuncDef:
+                self.functions.append(child)
+            elif t is _ClassDef:
+                self.classes.append(child)
+
+
+@functools.lru_cache(maxsize=4)
+def _read_and_parse(path, mtime_ns, size):
+    """Reads and parses a file, memoized on its path, modification time and
+    size so a file revisited shortly after in the same process is only parsed
+    once. The cache is kept small, every tree it holds is walked again by the
+    garbage collector.
+
+    # args
+    - path -str: an absolute filename
+    - mtime_ns -int: the file's modification time in ns, part of the cache key
+    - size -int: the file's size in bytes, part of the cache key
     """
-    with open(f) as file:
-        node = ast.parse(file.read())
+    with open(path, 'rb') as file:
+        return ast.parse(file.read(), filename=path)
+
+
+def _sections(node, f):
+    """Yields the docs for a parsed file one section at a time: the module
+    header, then each function, then each class with its methods.
 
-    print(f'# `{f}`')
-    print(format_docstring(ast.get_docstring(node)))
-    print()
+    # args
+    - node -Module: the parsed file
+    - f -str: the filename, used in the header
+    """
+    out = [f'# `{f}`', *_doc_lines(node), '']
+    yield '\n'.join(out) + '\n'
 
-    functions = [n for n in node.body if isinstance(n, ast.FunctionDef)]
-    classes = [n for n in node.body if isinstance(n, ast.ClassDef)]
+    collector = _Collector()
+    collector.visit(node)
 
-    for function in functions:
-        print_func(function)
+    for function in collector.functions:
+        out = []
+        _append_func(function, False, out)
+        yield '\n'.join(out) + '\n'
 
-    for class_ in classes:
-        stub = '## ' + class_stub(class_)
-        print(stub)
-        print(format_docstring(ast.get_docstring(class_)))
-        print('\n')
-        methods = [n for n in class_.body if isinstance(n, ast.FunctionDef)]
+    for class_ in collector.classes:
+        out = ['## ' + class_stub(class_)]
+        out.extend(_doc_lines(class_))
+        out.append('\n')
+        methods = [n for n in class_.body if type(n) is _FuncDef]
         for method in methods:
-            print_func(method, True)
-        print('***')
+            _append_func(method, True, out)
+        out.append('***')
+        yield '\n'.join(out) + '\n'
+
+
+def gendoc(f, write=None, encoding='utf-8'):
+    """Generates the docs from a file. If write is given, each section is
+    passed to it as soon as it is ready, otherwise the docs are returned as
+    a string.
+
+    # args
+    - f -str: a filename
+    - write -callable(None): a writer, e.g. sys.stdout.buffer.write
+    - encoding -str('utf-8'): encoding of the sections passed to write, if
+      None they are passed as str, e.g. for sys.stdout.write
+    """
+    st = os.stat(f)
+    node = _read_and_parse(os.path.abspath(f), st.st_mtime_ns, st.st_size)
+    if write is None:
+        return ''.join(_sections(node, f))
+    for section in _sections(node, f):
+        write(section.encode(encoding) if encoding else section)
 
 
 def main(files):
-    """Main entrypoint for the file,
+    """Main entrypoint for the file. Docs are written out in the order given,
+    section by section, or a whole file at a time when there are enough files
+    and CPUs for them to be generated in parallel.
 
     # args
     - files -list[str]: a list of file names to parse
     """
-    for file in files:
-        gendoc(file)
+    if len(files) < _PARALLEL_MIN_FILES or (os.cpu_count() or 1) < 2:
+        for file in files:
+            gendoc(file, sys.stdout.write, encoding=None)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor() as executor:
+        for doc in executor.map(gendoc, files):
+            sys.stdout.write(doc)
 
 
 if __name__ == "__main__":